@@ -0,0 +1,211 @@
+import contextlib
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel as DDP
+import wandb
+from datasets import load_dataset, load_from_disk
+from transformers import LlamaConfig, LlamaForCausalLM, LlamaTokenizerFast
+
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.benchmark = True
+torch.set_float32_matmul_precision('high')
+
+# launch with: torchrun --nproc_per_node=N llama.py
+dist.init_process_group('nccl')
+rank = dist.get_rank()
+world_size = dist.get_world_size()
+local_rank = int(os.environ.get('LOCAL_RANK', 0))
+torch.cuda.set_device(local_rank)
+
+context_len = 1024
+# activation checkpointing (below) frees the headroom for the bigger batch
+batch_size = 16
+accum_steps = 4
+steps_per_log = 32
+
+config = LlamaConfig(
+    vocab_size=32000,
+    hidden_size=1024,
+    intermediate_size=2816,
+    num_hidden_layers=8,
+    num_attention_heads=16,
+    max_position_embeddings=context_len,
+)
+
+tokenizer = LlamaTokenizerFast.from_pretrained('hf-internal-testing/llama-tokenizer')
+
+def tokenize(text):
+    return tokenizer(text['text'])
+
+TOKENIZED_CACHE = 'bookcorpus_tok'
+PACKED_CACHE = 'bookcorpus_packed.npy'
+
+# both caches are shared across ranks, so only rank 0 builds them (N ranks
+# each spawning cpu_count() map workers and rewriting the same files would
+# thrash the host and race); everyone else waits at the barrier and mmaps
+if rank == 0 and not os.path.exists(PACKED_CACHE):
+    if os.path.exists(TOKENIZED_CACHE):
+        tokenized = load_from_disk(TOKENIZED_CACHE)
+    else:
+        data = load_dataset('bookcorpus')
+        # the rust tokenizer releases the GIL and scales with bucket size, so
+        # big buckets + one proc per core make the one-time pass fast
+        tokenized = data.map(tokenize, batched=True, batch_size=10_000,
+                             num_proc=os.cpu_count(), remove_columns=['text'])
+        tokenized.save_to_disk(TOKENIZED_CACHE)
+    # flatten and window the corpus once into a [N, context_len] int32 array
+    # (the vocab fits in 17 bits, so int32 halves the bytes moved per step).
+    # range-slicing the numpy-formatted column pulls arrays straight out of
+    # arrow instead of materializing a python object per row
+    ds = tokenized['train'].with_format('numpy', columns=['input_ids'])
+    chunk = 100_000
+    all_ids = np.concatenate(
+        [np.concatenate(ds[i:i + chunk]['input_ids'])
+         for i in range(0, len(ds), chunk)]).astype(np.int32)
+    n_windows = len(all_ids) // context_len
+    # write to a temp file and rename into place so no rank can ever map a
+    # half-written npy
+    tmp = PACKED_CACHE + '.tmp.npy'
+    np.save(tmp, all_ids[:n_windows * context_len].reshape(n_windows, context_len))
+    os.replace(tmp, PACKED_CACHE)
+dist.barrier()
+
+# memory-map the packed corpus: later launches skip preprocessing entirely
+# and pages are only faulted in as their windows are read
+packed = np.load(PACKED_CACHE, mmap_mode='r')
+num_batches = len(packed) // batch_size
+
+def batch_at(i):
+    # .copy() lifts the mmap pages into a regular buffer pin_memory can stage
+    return torch.from_numpy(packed[i * batch_size:(i + 1) * batch_size].copy())
+
+class TokenBatches(torch.utils.data.IterableDataset):
+    # yields full [batch_size, context_len] batches (the DataLoader runs with
+    # batch_size=None); each (rank, worker) pair walks a disjoint contiguous
+    # slice of the packed corpus so packing never touches the training thread
+    def __iter__(self):
+        info = torch.utils.data.get_worker_info()
+        num_workers = info.num_workers if info is not None else 1
+        worker_id = info.id if info is not None else 0
+        shards = world_size * num_workers
+        shard = rank * num_workers + worker_id
+        per_shard = num_batches // shards
+        for i in range(shard * per_shard, (shard + 1) * per_shard):
+            yield batch_at(i)
+
+
+class PrefetchLoader:
+    # apex-style data prefetcher: the next batch's H2D copy is issued on a
+    # side stream while the current step computes
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __iter__(self):
+        stream = torch.cuda.Stream()
+        prev = None
+        for batch in self.loader:
+            with torch.cuda.stream(stream):
+                batch = batch.to('cuda', non_blocking=True)
+            if prev is not None:
+                yield prev
+            torch.cuda.current_stream().wait_stream(stream)
+            batch.record_stream(torch.cuda.current_stream())
+            prev = batch
+        if prev is not None:
+            yield prev
+
+
+def accuracy(logits, labels):
+    # accuracy is only a progress signal, so estimate it from a handful of
+    # positions instead of an argmax over the full [B, T, vocab] tensor
+    idx = torch.randint(0, logits.size(1) - 1, (128,), device=logits.device)
+    pred = torch.argmax(logits[:, idx], -1)
+    return (pred == labels[:, idx + 1]).float().mean()
+
+model = LlamaForCausalLM(config).cuda()
+# ~30% extra flops to recompute activations in backward, paid back by the
+# larger batch's tile efficiency; the kv cache is useless during training
+model.gradient_checkpointing_enable()
+model.config.use_cache = False
+model = DDP(model, device_ids=[local_rank], gradient_as_bucket_view=True)
+# context_len and batch_size are fixed, so static shapes let inductor cache a
+# single specialized graph
+model = torch.compile(model, mode='max-autotune', fullgraph=False, dynamic=False)
+# fused Adam does the whole elementwise update in one kernel per dtype group
+# instead of ~4 kernels per parameter tensor
+optimizer = torch.optim.Adam(model.parameters(), lr=3e-4, fused=True)
+
+# wandb.log still serializes on the calling thread, so push metrics through a
+# queue and let a daemon thread pay that cost instead of the training loop
+log_queue = queue.Queue()
+
+def log_worker():
+    for metrics, step in iter(log_queue.get, None):
+        wandb.log(metrics, step=step)
+
+if rank == 0:
+    wandb.init(project='grownet-llama')
+    log_thread = threading.Thread(target=log_worker, daemon=True)
+    log_thread.start()
+
+# throwaway batch to trigger compilation outside the timed loop
+warmup = batch_at(0).cuda()
+with torch.autocast(device_type='cuda', dtype=torch.bfloat16):
+    model(warmup, labels=warmup.long()).loss.backward()
+optimizer.zero_grad(set_to_none=True)
+del warmup
+
+loader = PrefetchLoader(torch.utils.data.DataLoader(
+    TokenBatches(), batch_size=None, num_workers=8,
+    pin_memory=True, prefetch_factor=4, persistent_workers=True,
+))
+
+# accumulate metrics as device tensors; float()/.item() every step would
+# force a stream sync and stall the pipeline
+acc_loss = torch.zeros((), device='cuda')
+n_batches = 0
+start = time.time()
+for i, data in enumerate(loader):
+    # only the accumulated gradients at the boundary need the allreduce, so
+    # non-final micro-steps run under no_sync
+    step_boundary = (i + 1) % accum_steps == 0
+    sync_ctx = contextlib.nullcontext() if step_boundary else model.no_sync()
+    with sync_ctx:
+        # bf16 shares fp32's exponent range, so no GradScaler is needed;
+        # backward and the Adam update stay outside the autocast region in fp32
+        with torch.autocast(device_type='cuda', dtype=torch.bfloat16):
+            # int32 ids are fine for the embedding lookup; only the
+            # cross-entropy labels need widening, done on device
+            outputs = model(data, labels=data.long())
+        (outputs.loss / accum_steps).backward()
+    acc_loss += outputs.loss.detach()
+    if step_boundary:
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+    n_batches += 1
+    if n_batches % steps_per_log == 0:
+        # one sync per interval: makes the wall clock cover completed GPU
+        # work and pays the device round trip only here
+        # only evaluate accuracy on the batch we log
+        acc = accuracy(outputs.logits.detach(), data)
+        torch.cuda.synchronize()
+        elapsed = time.time() - start
+        if rank == 0:
+            log_queue.put(({
+                'loss': acc_loss.item() / steps_per_log,
+                'accuracy': acc.item(),
+                'batches_per_sec': steps_per_log / elapsed,
+            }, n_batches))
+        acc_loss.zero_()
+        start = time.time()
+
+if rank == 0:
+    # flush whatever the logger thread has queued before exiting
+    log_queue.put(None)
+    log_thread.join()
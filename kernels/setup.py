@@ -5,21 +5,13 @@ from setuptools import setup, Extension
 from torch.utils import cpp_extension
 
 
-def filter_filename(filename):
-    accepted_extensions = ['.cu', '.cc']#, '.h', '.hpp', '.cuh']
-    for ext in accepted_extensions:
-        if filename.endswith(ext):
-            return True
-    return False
-
 def get_files(dirs):
-    files = []
-    for dir in dirs:
-        for root, dirnames, filenames in os.walk(dir):
-            for filename in filenames:
-                if filter_filename(filename):
-                    files.append(os.path.join(root, filename))
-    return files
+    # endswith takes a tuple, so one C-level check per file
+    return [os.path.join(root, filename)
+            for dir in dirs
+            for root, dirnames, filenames in os.walk(dir)
+            for filename in filenames
+            if filename.endswith(('.cu', '.cc'))]  # '.h', '.hpp', '.cuh'
 
 source_dir = os.getcwd()
 include_dirs = ['utils']
@@ -0,0 +1,145 @@
+import os
+
+import torch
+from torch import nn
+import torchvision
+from torchvision import transforms
+
+
+class ConvNextEmbedding(nn.Module):
+    # convnext_small with the per-stage feature maps exposed, returns
+    # ({stage: feat_map}, logits)
+    def __init__(self, num_classes=10, pretrained=True):
+        super().__init__()
+        weights = torchvision.models.ConvNeXt_Small_Weights.DEFAULT if pretrained else None
+        self.net = torchvision.models.convnext_small(weights=weights)
+        self.net.classifier[2] = nn.Linear(self.net.classifier[2].in_features, num_classes)
+
+    def forward(self, x):
+        emb = {}
+        h = x
+        # features alternates stem/downsample layers with block stages;
+        # record after each block stage
+        for i, stage in enumerate(self.net.features):
+            h = stage(h)
+            if i % 2 == 1:
+                emb[(i + 1) // 2] = h
+        logits = self.net.classifier(self.net.avgpool(h))
+        return emb, logits
+
+
+class ModulatedConv(nn.Module):
+    # stylegan2-style weight modulation/demodulation
+    def __init__(self, in_ch, out_ch, latent_dim, kernel=3):
+        super().__init__()
+        self.weight = nn.Parameter(
+            torch.randn(out_ch, in_ch, kernel, kernel) * (in_ch * kernel ** 2) ** -0.5)
+        self.affine = nn.Linear(latent_dim, in_ch)
+        self.padding = kernel // 2
+
+    def forward(self, x, latent):
+        b, c, h, w = x.shape
+        style = self.affine(latent).view(b, 1, c, 1, 1) + 1
+        weight = self.weight[None] * style
+        demod = torch.rsqrt(weight.pow(2).sum((2, 3, 4)) + 1e-8)
+        weight = weight * demod.view(b, -1, 1, 1, 1)
+        x = x.reshape(1, b * c, h, w)
+        weight = weight.reshape(-1, c, *self.weight.shape[2:])
+        out = nn.functional.conv2d(x, weight, padding=self.padding, groups=b)
+        return out.view(b, -1, h, w)
+
+
+class Generator(nn.Module):
+    # upsamples a feature map one stage back towards the image, conditioned
+    # on a latent
+    def __init__(self, in_ch, out_ch, latent_dim, hidden=256):
+        super().__init__()
+        self.conv1 = ModulatedConv(in_ch, hidden, latent_dim)
+        self.conv2 = ModulatedConv(hidden, hidden, latent_dim)
+        self.out = ModulatedConv(hidden, out_ch, latent_dim, kernel=1)
+
+    def forward(self, latent, x):
+        h = nn.functional.interpolate(x, scale_factor=2, mode='nearest')
+        h = nn.functional.leaky_relu(self.conv1(h, latent), 0.2)
+        h = nn.functional.leaky_relu(self.conv2(h, latent), 0.2)
+        return self.out(h, latent)
+
+
+batch_size = 32
+epochs = 10
+feat_map_no = 2
+latent_dim = 128
+augment = True
+steps_per_log = 50
+
+# image channels followed by the convnext_small stage widths
+channels = [3, 96, 192, 384, 768]
+
+transform = transforms.Compose(
+    ([transforms.RandomHorizontalFlip()] if augment else []) + [
+        transforms.Resize(128),
+        transforms.ToTensor(),
+        transforms.Normalize((0.4914, 0.4822, 0.4465), (0.247, 0.243, 0.261)),
+    ])
+
+dataset = torchvision.datasets.CIFAR10('data', train=True, download=True, transform=transform)
+train_loader = torch.utils.data.DataLoader(
+    dataset, batch_size=batch_size, shuffle=True,
+    num_workers=4, pin_memory=True, persistent_workers=True)
+
+embedding = ConvNextEmbedding(num_classes=10, pretrained=True).cuda()
+embedding.eval()
+# cudnn picks the NHWC tensor-core kernels for the convolutions
+embedding = embedding.to(memory_format=torch.channels_last)
+generator = Generator(channels[feat_map_no], channels[feat_map_no - 1], latent_dim).cuda()
+criterion = nn.MSELoss()
+optimizer = torch.optim.Adam(generator.parameters(), lr=1e-4)
+
+def embed(img):
+    # the encoder is frozen, so bf16 + no_grad halves its cost
+    with torch.no_grad(), torch.autocast('cuda', dtype=torch.bfloat16):
+        emb, _ = embedding(img)
+    # emb is keyed by stage number, so index the two maps we need directly
+    # rather than rebuilding a list of every stage each step
+    if feat_map_no == 1:
+        x, y = emb[1], img
+    else:
+        x, y = emb[feat_map_no], emb[feat_map_no - 1]
+    return x.float(), y.float()
+
+FEATURE_CACHE = 'convnext_features.pt'
+if not augment:
+    # without augmentation the encoder sees identical images every epoch, so
+    # run convnext over the dataset once and train from the cached pairs
+    if not os.path.exists(FEATURE_CACHE):
+        xs, ys = [], []
+        for inputs, _ in train_loader:
+            img = inputs.cuda(non_blocking=True).to(memory_format=torch.channels_last)
+            x, y = embed(img)
+            xs.append(x.cpu())
+            ys.append(y.cpu())
+        torch.save({'x': torch.cat(xs), 'y': torch.cat(ys)}, FEATURE_CACHE)
+    cache = torch.load(FEATURE_CACHE, mmap=True)
+    train_loader = torch.utils.data.DataLoader(
+        torch.utils.data.TensorDataset(cache['x'], cache['y']),
+        batch_size=batch_size, shuffle=True,
+        num_workers=4, pin_memory=True, persistent_workers=True)
+
+for epoch in range(epochs):
+    for step, batch in enumerate(train_loader):
+        if augment:
+            img = batch[0].cuda(non_blocking=True).to(memory_format=torch.channels_last)
+            x, y = embed(img)
+        else:
+            x = batch[0].cuda(non_blocking=True)
+            y = batch[1].cuda(non_blocking=True)
+        latent = torch.randn(x.shape[0], latent_dim, device='cuda')
+        # bf16 needs no GradScaler; Adam and its state stay fp32
+        with torch.autocast('cuda', dtype=torch.bfloat16):
+            xhat = generator(latent, x)
+            loss = criterion(xhat, y)
+        optimizer.zero_grad(set_to_none=True)
+        loss.backward()
+        optimizer.step()
+        if (step + 1) % steps_per_log == 0:
+            print(f'epoch {epoch} step {step + 1} loss {loss.item():.4f}')